@@ -1,12 +1,37 @@
 #!/usr/bin/env python3
 """Add a Telegram group to Clawdbot's allowlist and trigger reload."""
 
+import os
 import json
+import signal
 import argparse
-import subprocess
 from pathlib import Path
 
+try:
+    import orjson  # Optional: faster parse/serialize of clawdbot.json
+except ImportError:
+    orjson = None
+
 CONFIG_PATH = Path.home() / ".clawdbot" / "clawdbot.json"
+PID_FILE = Path.home() / ".clawdbot" / "clawdbot.pid"
+
+
+def load_json(raw: bytes):
+    """Parse JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dump_json(obj, indent: bool = False) -> bytes:
+    """Serialize to JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    # Fallback matches orjson's layout (compact separators, ensure_ascii=False),
+    # though floats may be spelled differently (1e+16 vs orjson's 1e16)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
 
 
 def add_group(chat_id: str, label: str = None):
@@ -15,19 +40,13 @@ def add_group(chat_id: str, label: str = None):
     chat_id = str(chat_id)
     
     # Read current config
-    with open(CONFIG_PATH, "r") as f:
-        config = json.load(f)
+    config = load_json(CONFIG_PATH.read_bytes())
     
     # Ensure telegram groups section exists
-    if "channels" not in config:
-        config["channels"] = {}
-    if "telegram" not in config["channels"]:
-        config["channels"]["telegram"] = {}
-    if "groups" not in config["channels"]["telegram"]:
-        config["channels"]["telegram"]["groups"] = {}
+    groups = config.setdefault("channels", {}).setdefault("telegram", {}).setdefault("groups", {})
     
     # Check if already exists
-    if chat_id in config["channels"]["telegram"]["groups"]:
+    if chat_id in groups:
         print(f"Group {chat_id} already in allowlist")
         return False
     
@@ -37,26 +56,72 @@ def add_group(chat_id: str, label: str = None):
     }
     if label:
         group_config["label"] = label
-    config["channels"]["telegram"]["groups"][chat_id] = group_config
+    groups[chat_id] = group_config
     
-    # Write updated config
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
+    # Write updated config atomically so Clawdbot never sees a partial file
+    data = dump_json(config, indent=True)
+    tmp_path = CONFIG_PATH.with_suffix(f'.json.{os.getpid()}.tmp')  # Per-process, so concurrent runs can't share it
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, CONFIG_PATH)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     
     print(f"Added group {chat_id} ({label or 'no label'}) to allowlist")
     return True
 
 
+def is_clawdbot_pid(pid: int) -> bool:
+    """Whether pid is a running Clawdbot process, judged by its command line."""
+    try:
+        argv = Path(f"/proc/{pid}/cmdline").read_bytes().split(b"\0")
+    except OSError:
+        return False  # Process exited or isn't ours to inspect
+    # Python processes are these skill scripts (often run from ~/.clawdbot),
+    # never Clawdbot itself - SIGUSR1 would kill them
+    if Path(argv[0].decode(errors="replace")).name.startswith("python"):
+        return False
+    return b"clawdbot" in b" ".join(argv)
+
+
+def find_clawdbot_pids() -> list:
+    """Find Clawdbot processes by command line, like `pgrep -f clawdbot` but in-process."""
+    skip = {os.getpid(), os.getppid()}  # Ourselves and whatever shell launched us
+    return [
+        int(proc.name)
+        for proc in Path("/proc").iterdir()
+        if proc.name.isdigit() and int(proc.name) not in skip and is_clawdbot_pid(int(proc.name))
+    ]
+
+
 def trigger_reload():
     """Signal Clawdbot to reload config."""
+    # Fast path: signal the PID Clawdbot recorded, no /proc scan. A stale
+    # file's PID may have been reused by another process, which SIGUSR1
+    # would kill, so only signal it if it still is Clawdbot.
+    try:
+        pid = int(PID_FILE.read_text().strip())
+    except (OSError, ValueError):
+        pid = None  # No (valid) PID file - fall back to matching by name
+    if pid is not None and is_clawdbot_pid(pid):
+        try:
+            os.kill(pid, signal.SIGUSR1)
+            print("Sent reload signal to Clawdbot")
+            return
+        except OSError:
+            pass  # Exited or not ours to signal - fall back to matching by name
+    
     try:
         # Find clawdbot process and send SIGUSR1
-        result = subprocess.run(
-            ["pkill", "-USR1", "-f", "clawdbot"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
+        sent = False
+        for pid in find_clawdbot_pids():
+            try:
+                os.kill(pid, signal.SIGUSR1)
+                sent = True
+            except ProcessLookupError:
+                pass
+        if sent:
             print("Sent reload signal to Clawdbot")
         else:
             print("Could not send reload signal (Clawdbot might not be running)")
@@ -4,6 +4,7 @@
 import asyncio
 import argparse
 import json
+import os
 from pathlib import Path
 
 CONFIG_PATH = Path(__file__).parent / "config.json"
@@ -12,9 +13,15 @@ SESSION_PATH = Path(__file__).parent / "argon_session"
 async def authenticate(api_id: int, api_hash: str):
     from pyrogram import Client
     
-    # Save config
-    with open(CONFIG_PATH, "w") as f:
-        json.dump({"api_id": api_id, "api_hash": api_hash}, f, indent=2)
+    # Save config atomically
+    data = json.dumps({"api_id": api_id, "api_hash": api_hash}, indent=2).encode()
+    tmp_path = CONFIG_PATH.with_suffix(f'.json.{os.getpid()}.tmp')  # Per-process, so concurrent runs can't share it
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, CONFIG_PATH)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     
     app = Client(str(SESSION_PATH), api_id=api_id, api_hash=api_hash)
     
@@ -28,6 +35,13 @@ def main():
     parser.add_argument("--api-id", type=int, required=True)
     parser.add_argument("--api-hash", required=True)
     args = parser.parse_args()
+    
+    try:
+        import uvloop  # Optional: faster event loop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(authenticate(args.api_id, args.api_hash))
 
 if __name__ == "__main__":
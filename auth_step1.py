@@ -19,4 +19,10 @@ async def main():
     print(f"✅ Code sent! Hash saved. Now run auth_step2.py with the code.")
     await app.disconnect()
 
+try:
+    import uvloop  # Optional: faster event loop
+    uvloop.install()
+except ImportError:
+    pass
+
 asyncio.run(main())
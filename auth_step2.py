@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """Step 2: Sign in with the code."""
+import os
 import sys
 import asyncio
 import json
+from pathlib import Path
 from pyrogram import Client
 
 API_ID = 39395768
@@ -29,13 +31,25 @@ async def main():
         user = await app.sign_in(PHONE, phone_code_hash, code)
         print(f"✅ Authenticated as: {user.first_name} (@{user.username})")
         
-        # Save config
-        with open(CONFIG_FILE, "w") as f:
-            json.dump({"api_id": API_ID, "api_hash": API_HASH}, f, indent=2)
+        # Save config atomically
+        data = json.dumps({"api_id": API_ID, "api_hash": API_HASH}, indent=2).encode()
+        tmp_path = Path(f"{CONFIG_FILE}.{os.getpid()}.tmp")  # Per-process, so concurrent runs can't share it
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, CONFIG_FILE)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
         
         await app.disconnect()
     except Exception as e:
         print(f"❌ Error: {e}")
         await app.disconnect()
 
+try:
+    import uvloop  # Optional: faster event loop
+    uvloop.install()
+except ImportError:
+    pass
+
 asyncio.run(main())
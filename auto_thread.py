@@ -11,9 +11,17 @@ Used by Clawdbot after responding in the General topic.
 
 import asyncio
 import json
+import os
+import random
 import re
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
+
+try:
+    import orjson  # Optional: faster parse/serialize for the state files
+except ImportError:
+    orjson = None
 
 # Paths
 CONFIG_DIR = Path(__file__).parent
@@ -21,27 +29,85 @@ SESSION_PATH = CONFIG_DIR / "argon_daemon"
 CONFIG_PATH = CONFIG_DIR / "config.json"
 STATE_PATH = CONFIG_DIR / "forum_state.json"
 
+# Upper bound on a single MTProto RPC so a stalled connection can't hang the caller
+RPC_TIMEOUT_SECONDS = 5.0
+
+# Topic-name heuristics
+_GREETING_RE = re.compile(r"^(hi|hello|hey|yo|sup|what'?s up)[,!?\s]*", re.IGNORECASE)
+_GREETING_PREFIXES = ('Hey', 'Hi', 'Hello', '👋')
+
+# Long-lived Pyrogram client, started on first use (see _get_client)
+_CLIENT = None
+_CLIENT_LOCK = asyncio.Lock()  # Only one caller may (re)build it - they share one session file
+
+# Resolved input peers keyed by chat_id (LRU, see _resolve_peer)
+_PEER_CACHE: "OrderedDict[int, Any]" = OrderedDict()
+_PEER_CACHE_SIZE = 256
+
+# Parsed JSON files keyed by path -> (st_mtime_ns, st_size, data)
+_CONFIG_CACHE: dict[Path, tuple[int, int, Any]] = {}
+
+
+def _json_loads(data: bytes):
+    """Parse JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj, indent: bool = True) -> bytes:
+    """Serialize to JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    # Fallback matches orjson's layout (compact separators, ensure_ascii=False),
+    # though floats may be spelled differently (1e+16 vs orjson's 1e16)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _load_json_cached(path: Path):
+    """Load a JSON file, re-parsing only when its mtime or size changed."""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _CONFIG_CACHE.get(path)
+    if hit and hit[:2] == key:
+        return hit[2]
+    data = _json_loads(path.read_bytes())
+    _CONFIG_CACHE[path] = (*key, data)
+    return data
+
 
 def load_telegram_config():
     """Load Telegram API credentials."""
     if CONFIG_PATH.exists():
-        with open(CONFIG_PATH) as f:
-            return json.load(f)
+        return _load_json_cached(CONFIG_PATH)
     return {}
 
 
 def load_forum_state():
     """Load forum state (tracks current General topic ID per forum)."""
     if STATE_PATH.exists():
-        with open(STATE_PATH) as f:
-            return json.load(f)
+        return _load_json_cached(STATE_PATH)
     return {}
 
 
 def save_forum_state(state: dict):
-    """Save forum state."""
-    with open(STATE_PATH, "w") as f:
-        json.dump(state, f, indent=2)
+    """Save forum state atomically (single write, then rename over the old file)."""
+    data = _json_dumps(state)
+    # Per-process temp file: the daemon may be saving forum_state.json right now
+    tmp_path = STATE_PATH.with_suffix(f'.json.{os.getpid()}.tmp')
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, STATE_PATH)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    # Write-through: the dict we just saved is the file's content, so seed
+    # the cache with it rather than re-parsing on the next load
+    st = os.stat(STATE_PATH)
+    _CONFIG_CACHE[STATE_PATH] = (st.st_mtime_ns, st.st_size, state)
 
 
 def get_current_general_topic(chat_id: int) -> int:
@@ -53,29 +119,41 @@ def get_current_general_topic(chat_id: int) -> int:
 def set_current_general_topic(chat_id: int, topic_id: int):
     """Set the current General topic ID for a forum."""
     state = load_forum_state()
-    if str(chat_id) not in state:
-        state[str(chat_id)] = {}
-    state[str(chat_id)]["general_topic_id"] = topic_id
+    forum = state.setdefault(str(chat_id), {})
+    if forum.get("general_topic_id") == topic_id:
+        return  # Already current - nothing to write
+    forum["general_topic_id"] = topic_id
     save_forum_state(state)
 
 
+def _iter_lines(text: str):
+    """Yield text's lines one at a time, slicing each out only when it is reached."""
+    start = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
 def generate_topic_name(user_message: str, bot_response: str, max_length: int = 40) -> str:
     """Generate a topic name from the conversation content."""
     # Use the first line of user message, cleaned up
     text = user_message.strip()
     
     # Remove common greetings
-    text = re.sub(r'^(hi|hello|hey|yo|sup|what\'?s up)[,!?\s]*', '', text, flags=re.IGNORECASE)
+    text = _GREETING_RE.sub('', text)
     
     # Take first sentence or line
-    text = text.split('\n')[0].split('.')[0].strip()
+    text = text.partition('\n')[0].partition('.')[0].strip()
     
     # If too short or empty, try to extract from bot response
     if len(text) < 5:
         # Extract a summary from bot response (first meaningful line)
-        for line in bot_response.split('\n'):
+        for line in _iter_lines(bot_response):
             line = line.strip()
-            if len(line) > 10 and not line.startswith(('Hey', 'Hi', 'Hello', '👋')):
+            if len(line) > 10 and not line.startswith(_GREETING_PREFIXES):
                 text = line
                 break
     
@@ -86,6 +164,60 @@ def generate_topic_name(user_message: str, bot_response: str, max_length: int =
     return text or "Conversation"
 
 
+async def _get_client():
+    """Return the module-level Pyrogram client, starting it on first use."""
+    global _CLIENT
+    from pyrogram import Client
+    
+    async with _CLIENT_LOCK:
+        if _CLIENT is None or not _CLIENT.is_connected:
+            await _stop_client()  # Release a stale client's session file first
+            
+            config = load_telegram_config()
+            if not config:
+                raise RuntimeError("Telegram not authenticated")
+            
+            client = Client(
+                str(SESSION_PATH),
+                api_id=config["api_id"],
+                api_hash=config["api_hash"]
+            )
+            await client.start()
+            _CLIENT = client  # Only publish it once it started
+        return _CLIENT
+
+
+async def _stop_client():
+    """Stop and forget the module-level client; the caller holds _CLIENT_LOCK."""
+    global _CLIENT
+    if _CLIENT is not None:
+        try:
+            await _CLIENT.stop()
+        except ConnectionError:
+            pass  # Already terminated
+    _CLIENT = None
+
+
+async def _resolve_peer(app, chat_id: int):
+    """Resolve a chat's input peer, memoized across calls."""
+    peer = _PEER_CACHE.get(chat_id)
+    if peer is not None:
+        _PEER_CACHE.move_to_end(chat_id)
+        return peer
+    
+    peer = await app.resolve_peer(chat_id)
+    _PEER_CACHE[chat_id] = peer
+    if len(_PEER_CACHE) > _PEER_CACHE_SIZE:
+        _PEER_CACHE.popitem(last=False)
+    return peer
+
+
+async def close_client():
+    """Stop the module-level client, if one was started."""
+    async with _CLIENT_LOCK:
+        await _stop_client()
+
+
 async def auto_thread(
     chat_id: int,
     current_topic_id: int,
@@ -104,83 +236,96 @@ async def auto_thread(
     
     If `client` is provided, uses that client instead of creating a new one.
     This prevents SQLite session lock conflicts when called from the daemon.
+    Otherwise a module-level client is started once and reused across calls;
+    call `close_client()` when done.
     """
-    from pyrogram import Client
-    from pyrogram.raw import functions
-    
-    # Use provided client or create new one
-    if client:
-        # Client already connected, use directly
-        return await _auto_thread_impl(client, chat_id, current_topic_id, new_topic_name, bot_welcome_message)
-    
-    # No client provided - create our own
-    config = load_telegram_config()
-    if not config:
-        raise RuntimeError("Telegram not authenticated")
-    
-    app = Client(
-        str(SESSION_PATH),
-        api_id=config["api_id"],
-        api_hash=config["api_hash"]
-    )
-    
-    async with app:
-        return await _auto_thread_impl(app, chat_id, current_topic_id, new_topic_name, bot_welcome_message)
+    # Use provided client or the shared long-lived one
+    app = client or await _get_client()
+    return await _auto_thread_impl(app, chat_id, current_topic_id, new_topic_name, bot_welcome_message)
 
 
 async def _auto_thread_impl(app, chat_id, current_topic_id, new_topic_name, bot_welcome_message):
     """Internal implementation that uses a provided client."""
     from pyrogram.raw import functions
     
-    peer = await app.resolve_peer(chat_id)
+    peer = await _resolve_peer(app, chat_id)
+    random_id = random.getrandbits(63)  # Only needs to be unique, not secret
     
-    # 1. Rename the current topic
-    try:
-        await app.invoke(
-            functions.channels.EditForumTopic(
-                channel=peer,
-                topic_id=current_topic_id,
-                title=new_topic_name
-            )
-        )
+    # 1. Rename the current topic and 2. create a new "General" topic.
+    # The two are independent, so both RPCs are in flight at once.
+    rename_result, result = await asyncio.gather(
+        asyncio.wait_for(
+            app.invoke(
+                functions.channels.EditForumTopic(
+                    channel=peer,
+                    topic_id=current_topic_id,
+                    title=new_topic_name
+                )
+            ),
+            timeout=RPC_TIMEOUT_SECONDS
+        ),
+        asyncio.wait_for(
+            app.invoke(
+                functions.channels.CreateForumTopic(
+                    channel=peer,
+                    title="General",
+                    random_id=random_id,
+                    icon_color=0x6FB9F0  # Blue color
+                )
+            ),
+            timeout=RPC_TIMEOUT_SECONDS
+        ),
+        return_exceptions=True
+    )
+    
+    if isinstance(rename_result, BaseException):
+        print(f"⚠️ Could not rename topic: {rename_result}")
+    else:
         print(f"✅ Renamed topic {current_topic_id} to: {new_topic_name}")
-    except Exception as e:
-        print(f"⚠️ Could not rename topic: {e}")
     
-    # 2. Create new "General" topic
     try:
-        result = await app.invoke(
-            functions.channels.CreateForumTopic(
-                channel=peer,
-                title="General",
-                random_id=int.from_bytes(__import__('os').urandom(4), 'big'),
-                icon_color=0x6FB9F0  # Blue color
-            )
-        )
-        # Extract new topic ID from updates
+        if isinstance(result, asyncio.TimeoutError):
+            # The topic may still have been created server-side; the topic
+            # list fallback below finds it if so
+            print(f"⚠️ CreateForumTopic timed out after {RPC_TIMEOUT_SECONDS}s")
+            updates = []
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            updates = result.updates
+        
+        # Extract new topic ID from updates: the topic ID is the ID of the
+        # service message that opened it, which Telegram reports back in an
+        # UpdateMessageID carrying the random_id we sent.
         new_topic_id = None
-        for update in result.updates:
-            if hasattr(update, 'message') and hasattr(update.message, 'reply_to'):
-                if hasattr(update.message.reply_to, 'forum_topic') and update.message.reply_to.forum_topic:
-                    new_topic_id = update.message.reply_to.reply_to_msg_id
-                    break
+        for update in updates:
+            if getattr(update, 'random_id', None) == random_id:
+                new_topic_id = update.id
+                break
         
         if not new_topic_id:
-            # Fallback: get latest topics and find the new General
-            topics_result = await app.invoke(
-                functions.channels.GetForumTopics(
-                    channel=peer,
-                    offset_date=0,
-                    offset_id=0,
-                    offset_topic=0,
-                    limit=10
-                )
+            # Fallback: only the newest few topics can be the one we just created
+            print(f"⚠️ New General topic ID not found in CreateForumTopic response, listing topics")
+            topics_result = await asyncio.wait_for(
+                app.invoke(
+                    functions.channels.GetForumTopics(
+                        channel=peer,
+                        offset_date=0,
+                        offset_id=0,
+                        offset_topic=0,
+                        limit=5
+                    )
+                ),
+                timeout=RPC_TIMEOUT_SECONDS
             )
             for topic in topics_result.topics:
                 if getattr(topic, 'title', '') == "General" and topic.id != current_topic_id:
                     new_topic_id = topic.id
                     break
         
+        if not new_topic_id and isinstance(result, asyncio.TimeoutError):
+            raise result
+        
         print(f"✅ Created new General topic with ID: {new_topic_id}")
     except Exception as e:
         print(f"❌ Could not create new General topic: {e}")
@@ -211,15 +356,24 @@ async def main():
     
     topic_id = args.topic_id or get_current_general_topic(args.chat_id)
     
-    result = await auto_thread(
-        chat_id=args.chat_id,
-        current_topic_id=topic_id,
-        new_topic_name=args.name,
-        bot_welcome_message=args.welcome
-    )
+    try:
+        result = await auto_thread(
+            chat_id=args.chat_id,
+            current_topic_id=topic_id,
+            new_topic_name=args.name,
+            bot_welcome_message=args.welcome
+        )
+    finally:
+        await close_client()
     
     print(json.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # Optional: faster event loop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(main())
@@ -4,34 +4,79 @@ Auto-threading daemon for Telegram forums.
 
 Monitors the General topic in configured forums and auto-threads
 when new conversations are detected (user message + bot response).
+Checks run as soon as a user posts in a monitored forum's General, with
+the --interval poll kept as a fallback (backing off to 300s while idle).
 
 Run as: python autothread_daemon.py --daemon
 Or one-shot: python autothread_daemon.py --once
 """
 
 import asyncio
+import hashlib
+import itertools
 import json
+import re
 import time
 import os
+import random
+import signal
 import argparse
+import logging
+import queue
+import sys
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 from contextlib import asynccontextmanager
-import traceback
+from dataclasses import dataclass
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+
+from pyrogram import Client, filters
+from pyrogram.errors import ChannelInvalid, ChannelPrivate, PeerIdInvalid, RPCError
+from pyrogram.handlers import MessageHandler
+from pyrogram.raw import functions, types
+
+try:
+    import orjson  # Optional: faster parse/serialize for the state files
+except ImportError:
+    orjson = None
+
+log = logging.getLogger("autothread")
 
 # Config
 CONFIG_DIR = Path(__file__).parent
 STATE_PATH = CONFIG_DIR / "forum_state.json"
 DAEMON_STATE_PATH = CONFIG_DIR / "daemon_state.json"
-BOT_TOKEN = "8549153948:AAHfqzF7yxBULVB0KJ0dZQsCOqsSh9xHSkk"
-BOT_ID = 8549153948
+BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "8549153948:AAHfqzF7yxBULVB0KJ0dZQsCOqsSh9xHSkk")
+BOT_ID = int(BOT_TOKEN.partition(":")[0])  # A bot's user ID is the token's prefix
+SEND_MESSAGE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
 
 # Anti-race settings
 COOLDOWN_AFTER_CREATE_SECONDS = 15  # Wait 15 seconds after creating a topic before processing
 COOLDOWN_AFTER_AUTOTHREAD_SECONDS = 10  # Wait 10 seconds after auto-threading before next check
 MIN_MESSAGES_FOR_AUTOTHREAD = 2  # Minimum messages required (bot welcome + user message)
+REPLIES_PROBE_LIMIT = 2  # First, small GetReplies page; settles the idle "only the welcome" case
+REPLIES_FULL_LIMIT = 15  # Page fetched when the probe comes back full
+MAX_CONCURRENT_FORUMS = 5  # Forums checked in parallel (stay within per-account rate limits)
 STATE_CLEANUP_AGE_DAYS = 7  # Clean up processed entries older than this
+STATE_CLEANUP_INTERVAL_SECONDS = 3600  # Run that cleanup at most this often
+MAX_STATE_ENTRIES = 512  # Cap on processed/created_topics; oldest entries are evicted first
+SAVE_DEBOUNCE_SECONDS = 0.5  # Coalesce daemon_state writes made within this window
+IDLE_BACKOFF_FACTOR = 1.5  # Stretch the fallback poll by this much after each idle check
+MAX_IDLE_INTERVAL_SECONDS = 300  # ...up to this; a new message or an auto-thread resets it
+IDLE_JITTER_SECONDS = 5  # Random extra sleep on idle polls so restarts don't poll in lockstep
+GENERAL_VERIFY_TTL_SECONDS = 300  # Trust a verified General this long before asking Telegram again
+
+# Title extraction: "**Header**" at the start of a bot response line
+_BOLD_HEADER_RE = re.compile(r'\*\*(.*?)\*\*')
+# First sentence of a message: everything before the first newline or period
+_FIRST_SENTENCE_RE = re.compile(r'[^\n.]*')
+# User messages too trivial to name a topic after
+_SKIP_TEXTS = frozenset(['hi', 'hello', 'hey', 'yo', '?', 'test', 'ok', 'yes', 'no'])
+# Bot welcome openers (lowercase); such responses are skipped
+_BOT_GREETING_PREFIXES = ('hey', 'hi', 'hello', '👋', "what's on")
 
 # Forums to monitor (chat_id -> config)
 MONITORED_FORUMS = {
@@ -42,42 +87,150 @@ MONITORED_FORUMS = {
     }
 }
 
-# Global lock to prevent concurrent runs
-_daemon_lock = asyncio.Lock()
+DEFAULT_WELCOME = "👋 What's on your mind?"
+
+@dataclass(frozen=True, slots=True)
+class ForumConfig:
+    """A monitored forum's settings, normalized once from MONITORED_FORUMS."""
+    name: str = ""
+    welcome_message: str = DEFAULT_WELCOME
+    persistent_topics: frozenset = frozenset()
+
+_FORUMS = {
+    chat_id: ForumConfig(
+        name=cfg.get("name", ""),
+        welcome_message=cfg.get("welcome_message", DEFAULT_WELCOME),
+        persistent_topics=frozenset(cfg.get("persistent_topics", ()))
+    )
+    for chat_id, cfg in MONITORED_FORUMS.items()
+}
+_UNMONITORED = ForumConfig()  # Defaults for a chat_id not in MONITORED_FORUMS
+
+# Per-forum locks to prevent concurrent runs on the same forum (forums don't block each other)
+_forum_locks = {}
+
+# Held from the global-cooldown check to its stamp, so two forums can't both auto-thread at once
+_autothread_lock = asyncio.Lock()
 
 # Shared client instance for connection reuse
 _shared_client = None
 _client_lock = asyncio.Lock()
 
+# In-memory daemon state: loaded once, written back by a debounced flush
+_daemon_state = None
+_daemon_state_dirty = False
+_flush_task = None
+
+_last_cleanup = 0.0  # time.time() of the last cleanup_old_state pass
+
+# Keep-alive HTTP session for Bot API calls (see new_http_session)
+_http = None
+
+# Resolved input peers per chat_id; they don't change for a monitored forum
+_peer_cache = {}
+
+# Parsed state files: path -> (st_mtime_ns, st_size, data), see load_state
+_state_cache = {}
+
+# path -> (digest of the bytes last written, st_mtime_ns right after), see write_state
+_last_written = {}
+
+# chat_id -> (General topic id, time.time() until which it is trusted without an RPC)
+_general_valid_until = {}
+
+# Set by the update handler when a monitored forum gets a message; wakes run_daemon early
+_wakeup = asyncio.Event()
+
+# Low bits of CreateForumTopic random_ids, seeded from the clock (see next_random_id)
+_random_ids = itertools.count(time.time_ns() & 0xFFFFFFFF)
+
 def load_state(path: Path) -> dict:
-    """Load state with error handling for corrupted files."""
+    """Load state with error handling for corrupted files.
+    
+    Parsed files are cached and only re-read when their mtime or size
+    changes. The cached dict is shared: callers that modify it must save it.
+    """
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return {}
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _state_cache.get(path)
+    if cached and cached[:2] == key:
+        return cached[2]
     try:
-        if path.exists():
-            with open(path) as f:
-                return json.load(f)
+        raw = path.read_bytes()
+        state = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        _state_cache[path] = (*key, state)
+        return state
     except (json.JSONDecodeError, IOError) as e:
-        print(f"[{datetime.now()}] Warning: Failed to load {path}: {e}")
-        # Backup corrupted file
-        if path.exists():
-            backup_path = path.with_suffix('.json.bak')
-            try:
-                path.rename(backup_path)
-                print(f"[{datetime.now()}] Backed up corrupted state to {backup_path}")
-            except:
-                pass
+        log.warning(f"Failed to load {path}: {e}")
+        # Backup corrupted file (the rename fails harmlessly if it vanished)
+        backup_path = path.with_suffix('.json.bak')
+        try:
+            path.rename(backup_path)
+            log.info(f"Backed up corrupted state to {backup_path}")
+        except OSError:
+            pass
     return {}
 
-def save_state(path: Path, state: dict):
+def encode_state(state: dict, compact: bool = False) -> bytes:
+    """Serialize state (orjson when available); compact=True drops indentation for files only the daemon reads."""
+    if orjson is not None:
+        return orjson.dumps(state, option=0 if compact else orjson.OPT_INDENT_2)
+    # Fallback matches orjson's layout (compact separators, ensure_ascii=False),
+    # though floats may be spelled differently (1e+16 vs orjson's 1e16)
+    if compact:
+        return json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode()
+    return json.dumps(state, indent=2, ensure_ascii=False).encode()
+
+def save_state(path: Path, state: dict, compact: bool = False):
     """Save state atomically to prevent corruption."""
-    tmp_path = path.with_suffix('.json.tmp')
+    if write_state(path, encode_state(state, compact)):
+        # Write-through: the dict is the file's content now, so seed the
+        # cache rather than re-parsing on the next load
+        st = path.stat()
+        _state_cache[path] = (st.st_mtime_ns, st.st_size, state)
+
+def write_state(path: Path, data: bytes) -> bool:
+    """Atomically replace path with already-serialized state (safe to run in a worker thread).
+    
+    Skips the write when the bytes match what we last wrote to path and
+    nobody else (e.g. auto_thread.py) has replaced the file since.
+    Returns True if path now holds data.
+    """
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    last = _last_written.get(path)
+    if last and last[0] == digest:
+        try:
+            if path.stat().st_mtime_ns == last[1]:
+                return True
+        except FileNotFoundError:
+            pass
+    # Per-process temp file, so a concurrent auto_thread.py run can't share it.
+    # Plain open() keeps umask permissions (mkstemp would make the file 0600).
+    tmp_path = path.with_suffix(f'.json.{os.getpid()}.tmp')
     try:
-        with open(tmp_path, "w") as f:
-            json.dump(state, f, indent=2)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)  # One write instead of json.dump's many small ones
+            f.flush()
+            os.fsync(f.fileno())  # Content is on disk before the rename can be
         tmp_path.replace(path)  # Atomic on POSIX
+        fsync_dir(path.parent)  # Make the rename itself durable
+        _last_written[path] = (digest, path.stat().st_mtime_ns)
+        return True
     except IOError as e:
-        print(f"[{datetime.now()}] Error saving state to {path}: {e}")
-        if tmp_path.exists():
-            tmp_path.unlink()
+        log.error(f"Error saving state to {path}: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+
+def fsync_dir(directory: Path):
+    """Flush a directory entry change (e.g. a rename) to disk."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 def get_current_general(chat_id: int) -> int:
     state = load_state(STATE_PATH)
@@ -92,46 +245,143 @@ def set_current_general_topic(chat_id: int, topic_id: int):
     save_state(STATE_PATH, state)
 
 def get_daemon_state() -> dict:
-    return load_state(DAEMON_STATE_PATH)
+    """Return the in-memory daemon state, loading it from disk on first use."""
+    global _daemon_state
+    if _daemon_state is None:
+        _daemon_state = prune_cooldown_entries(load_state(DAEMON_STATE_PATH))
+    return _daemon_state
 
 def save_daemon_state(state: dict):
-    save_state(DAEMON_STATE_PATH, state)
+    """Mark daemon state as changed; it is written to disk after SAVE_DEBOUNCE_SECONDS."""
+    global _daemon_state, _daemon_state_dirty, _flush_task
+    _daemon_state = state
+    _daemon_state_dirty = True
+    
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        flush_daemon_state()  # No event loop to debounce on - write now
+        return
+    if _flush_task is None or _flush_task.done():
+        _flush_task = loop.create_task(_debounced_flush())
+
+async def _debounced_flush():
+    global _daemon_state_dirty
+    # Loop until clean: a save that lands while the write below is in flight
+    # finds this task still running and doesn't schedule another one
+    while _daemon_state_dirty and _daemon_state is not None:
+        await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+        # Serialize on the loop, where no coroutine can mutate the dict mid-dump;
+        # only the disk write moves to a thread
+        data = encode_state(_daemon_state, compact=True)
+        _daemon_state_dirty = False
+        await asyncio.to_thread(write_state, DAEMON_STATE_PATH, data)
+
+def flush_daemon_state():
+    """Write daemon state to disk now if it has unsaved changes."""
+    global _daemon_state_dirty
+    if _daemon_state_dirty and _daemon_state is not None:
+        save_state(DAEMON_STATE_PATH, _daemon_state, compact=True)
+        _daemon_state_dirty = False
+
+def entry_time(entry) -> float:
+    """Epoch seconds of a state entry ("ts", or the ISO "timestamp" older state files carry).
+    
+    Missing or unparseable times count as 0, i.e. long past any cooldown.
+    """
+    if isinstance(entry, dict):
+        ts = entry.get("ts")
+        if ts is not None:
+            return ts
+        entry = entry.get("timestamp")
+    if isinstance(entry, (int, float)):
+        return entry
+    try:
+        return datetime.fromisoformat(entry).timestamp()
+    except (ValueError, TypeError):
+        return 0.0
+
+def prune_cooldown_entries(daemon_state: dict) -> dict:
+    """Drop new_general_index and created_topics entries long past the create cooldown.
+    
+    Both only feed the anti-race cooldown checks, so anything older is dead weight.
+    """
+    cutoff = time.time() - COOLDOWN_AFTER_CREATE_SECONDS * 10
+    for key in ["new_general_index", "created_topics"]:
+        entries = daemon_state.get(key)
+        if not entries:
+            continue
+        for entry_key in [k for k, v in entries.items() if entry_time(v) < cutoff]:
+            del entries[entry_key]
+    return daemon_state
+
+def remember(entries: dict, key: str, value):
+    """Insert into a bounded state table, evicting the oldest entries past MAX_STATE_ENTRIES."""
+    entries.pop(key, None)  # Re-insert so the entry moves to the newest end
+    entries[key] = value
+    while len(entries) > MAX_STATE_ENTRIES:
+        del entries[next(iter(entries))]
 
 def cleanup_old_state(daemon_state: dict) -> dict:
-    """Remove old entries from processed and created_topics to prevent unbounded growth."""
-    cutoff = datetime.now() - timedelta(days=STATE_CLEANUP_AGE_DAYS)
+    """Remove old entries from processed and created_topics to prevent unbounded growth.
+    
+    Runs at most once per STATE_CLEANUP_INTERVAL_SECONDS; entries only expire
+    after days, and the cooldown checks compare ages themselves.
+    """
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < STATE_CLEANUP_INTERVAL_SECONDS:
+        return daemon_state
+    _last_cleanup = now
+    
+    tables = ("processed", "created_topics", "new_general_index")
+    before = sum(len(daemon_state.get(key, ())) for key in tables)
     
+    cutoff = now - STATE_CLEANUP_AGE_DAYS * 86400
     for key in ["processed", "created_topics"]:
         if key not in daemon_state:
             continue
-        to_remove = []
-        for entry_key, entry_data in daemon_state[key].items():
-            try:
-                ts = datetime.fromisoformat(entry_data.get("timestamp", ""))
-                if ts < cutoff:
-                    to_remove.append(entry_key)
-            except (ValueError, TypeError):
-                to_remove.append(entry_key)  # Remove entries with invalid timestamps
-        
-        for entry_key in to_remove:
-            del daemon_state[key][entry_key]
+        entries = daemon_state[key]
+        for entry_key in [k for k, v in entries.items() if entry_time(v) < cutoff]:
+            del entries[entry_key]  # Also drops entries with invalid timestamps
+    prune_cooldown_entries(daemon_state)
     
+    if sum(len(daemon_state.get(key, ())) for key in tables) != before:
+        save_daemon_state(daemon_state)  # Persist the smaller state
     return daemon_state
 
+def mark_general_verified(chat_id: int, topic_id: int):
+    """Record that topic_id is a live, open General, skipping re-checks for GENERAL_VERIFY_TTL_SECONDS."""
+    _general_valid_until[chat_id] = (topic_id, time.time() + GENERAL_VERIFY_TTL_SECONDS)
+
+def invalidate_general(chat_id: int):
+    """Forget that a forum's General was verified, so the next check asks Telegram again."""
+    _general_valid_until.pop(chat_id, None)
+
+async def _on_forum_message(client, message):
+    """Update handler: a user wrote in a monitored forum's General, check it now instead of at the next tick."""
+    # Topic messages reply to the topic's root (or to a message inside it);
+    # messages in the original General (id 1) carry no reply at all
+    thread_id = message.reply_to_top_message_id or message.reply_to_message_id or 1
+    if thread_id == get_current_general(message.chat.id):
+        _wakeup.set()
+
+@lru_cache(maxsize=1)
+def load_api_config() -> dict:
+    """Load Telegram API credentials once; they don't change while the daemon runs."""
+    config_path = CONFIG_DIR / "config.json"
+    if not config_path.exists():
+        raise FileNotFoundError(f"Config not found: {config_path}")
+    return json.loads(config_path.read_text())
+
 @asynccontextmanager
 async def get_pyrogram_client():
     """Get a shared Pyrogram client with proper lifecycle management."""
     global _shared_client
     
-    from pyrogram import Client
-    
     async with _client_lock:
         if _shared_client is None or not _shared_client.is_connected:
-            config_path = CONFIG_DIR / "config.json"
-            if not config_path.exists():
-                raise FileNotFoundError(f"Config not found: {config_path}")
-            
-            config = json.load(open(config_path))
+            config = load_api_config()
             session_path = CONFIG_DIR / "argon_daemon"
             
             _shared_client = Client(
@@ -139,13 +389,22 @@ async def get_pyrogram_client():
                 api_id=config["api_id"],
                 api_hash=config["api_hash"]
             )
+            _shared_client.add_handler(
+                MessageHandler(_on_forum_message, filters.chat(list(MONITORED_FORUMS)) & ~filters.user(BOT_ID))
+            )
             await _shared_client.start()
     
     try:
         yield _shared_client
+    except (PeerIdInvalid, ChannelInvalid, ChannelPrivate):
+        _peer_cache.clear()  # A cached peer went stale (e.g. access hash changed) - resolve again
+        raise
+    except RPCError:
+        raise  # Telegram answered, so the connection is fine - keep it
     except Exception as e:
         # On error, disconnect to force fresh connection next time
-        print(f"[{datetime.now()}] Client error, will reconnect: {e}")
+        log.warning(f"Client error, will reconnect: {e}")
+        _peer_cache.clear()  # Re-resolve peers (from the session DB) on the fresh client
         async with _client_lock:
             if _shared_client and _shared_client.is_connected:
                 try:
@@ -163,6 +422,52 @@ async def shutdown_client():
             await _shared_client.stop()
         _shared_client = None
 
+async def resolve_peer_cached(app, chat_id: int):
+    """Resolve a chat's input peer once and reuse it on later calls."""
+    peer = _peer_cache.get(chat_id)
+    if peer is None:
+        peer = await app.resolve_peer(chat_id)
+        _peer_cache[chat_id] = peer
+    return peer
+
+def new_http_session() -> requests.Session:
+    """Create the Bot API session; pooled connections skip a TLS handshake per send."""
+    global _http
+    if _http is not None:
+        _http.close()  # Release the old pool's sockets before replacing it
+    _http = requests.Session()
+    _http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return _http
+
+def get_http_session() -> requests.Session:
+    return _http or new_http_session()
+
+def close_http_session():
+    """Close pooled Bot API connections."""
+    global _http
+    if _http is not None:
+        _http.close()
+        _http = None
+
+def message_payload(chat_id: int, topic_id: int, text: str) -> bytes:
+    """Encode a sendMessage body once, so retries can reuse it."""
+    payload = {
+        "chat_id": chat_id,
+        "message_thread_id": topic_id,
+        "text": text
+    }
+    return encode_state(payload, compact=True)
+
+async def send_message(body: bytes) -> requests.Response:
+    """Send an encoded Bot API message (see message_payload) without blocking the event loop."""
+    return await asyncio.to_thread(
+        get_http_session().post,
+        SEND_MESSAGE_URL,
+        data=body,
+        headers={"Content-Type": "application/json"},
+        timeout=10
+    )
+
 def get_recent_messages(chat_id: int, topic_id: int, limit: int = 10) -> list:
     """Get recent messages from a topic using the Telegram Bot API."""
     # Note: Bot API doesn't have a direct "get messages from topic" endpoint.
@@ -178,140 +483,195 @@ def has_meaningful_content(msg) -> tuple[str, bool, str]:
     """
     # Safely extract text
     raw_text = getattr(msg, 'message', None)
-    text = (raw_text[:100] if raw_text else '').strip()
+    text = raw_text.strip() if raw_text else ''
     
     # Check for various media types
     media = getattr(msg, 'media', None)
     has_media = media is not None
-    media_type = ""
-    
-    if has_media:
-        # Determine specific media type for better logging
-        media_class = type(media).__name__
-        if 'Voice' in media_class or 'Audio' in media_class:
-            media_type = "voice/audio"
-        elif 'Photo' in media_class:
-            media_type = "photo"
-        elif 'Video' in media_class:
-            media_type = "video"
-        elif 'Document' in media_class:
-            media_type = "document"
-        elif 'Sticker' in media_class:
-            media_type = "sticker"
-        elif 'Animation' in media_class:
-            media_type = "animation/gif"
-        else:
-            media_type = media_class
+    media_type = media_label(type(media)) if has_media else ""
     
     return text, has_media, media_type
 
-async def check_for_user_message_mtproto(chat_id: int, topic_id: int) -> bool:
-    """Check if there's a valid conversation in this topic.
+@lru_cache(maxsize=64)
+def media_label(media_class: type) -> str:
+    """Label a media type for logging; cached per class, since there are only a few."""
+    name = media_class.__name__
+    if 'Voice' in name or 'Audio' in name:
+        return "voice/audio"
+    elif 'Photo' in name:
+        return "photo"
+    elif 'Video' in name:
+        return "video"
+    elif 'Document' in name:
+        return "document"
+    elif 'Sticker' in name:
+        return "sticker"
+    elif 'Animation' in name:
+        return "animation/gif"
+    return name
+
+async def fetch_topic_messages(chat_id: int, topic_id: int, probe: bool = True) -> list:
+    """Fetch a topic's recent raw messages (newest first); [] on error.
     
-    Returns True only if:
-    - At least 2 messages total
-    - At least 1 bot message (welcome)
-    - At least 1 user message AFTER the bot's welcome (with text OR media like voice/photo)
+    With probe=True a small page is fetched first and the full page only
+    when the small one comes back full (see REPLIES_PROBE_LIMIT).
     """
     try:
         async with get_pyrogram_client() as app:
-            from pyrogram.raw import functions
-            peer = await app.resolve_peer(chat_id)
+            peer = await resolve_peer_cached(app, chat_id)
             
-            # Get recent messages from the topic
-            result = await app.invoke(
-                functions.messages.GetReplies(
-                    peer=peer,
-                    msg_id=topic_id,  # The topic's root message
-                    offset_id=0,
-                    offset_date=0,
-                    add_offset=0,
-                    limit=15,  # Increased limit for better coverage
-                    max_id=0,
-                    min_id=0,
-                    hash=0
+            async def get_replies(limit: int):
+                return await app.invoke(
+                    functions.messages.GetReplies(
+                        peer=peer,
+                        msg_id=topic_id,  # The topic's root message
+                        offset_id=0,
+                        offset_date=0,
+                        add_offset=0,
+                        limit=limit,
+                        max_id=0,
+                        min_id=0,
+                        hash=0
+                    )
                 )
-            )
-            
-            # Collect messages with timestamps
-            messages = []
-            for msg in result.messages:
-                if not hasattr(msg, 'from_id') or not hasattr(msg, 'date'):
-                    continue
-                    
-                from_id = getattr(msg.from_id, 'user_id', None)
-                if not from_id:
-                    continue
-                
-                text, has_media, media_type = has_meaningful_content(msg)
-                
-                messages.append({
-                    'from_id': from_id,
-                    'date': msg.date,
-                    'is_bot': from_id == BOT_ID,
-                    'text': text,
-                    'has_media': has_media,
-                    'media_type': media_type,
-                    'msg_id': getattr(msg, 'id', 0)
-                })
-            
-            # Sort by date (oldest first)
-            messages.sort(key=lambda x: x['date'])
-            
-            # Need at least 2 messages total
-            if len(messages) < MIN_MESSAGES_FOR_AUTOTHREAD:
-                print(f"[{datetime.now()}] Topic {topic_id}: only {len(messages)} messages (need {MIN_MESSAGES_FOR_AUTOTHREAD})")
-                return False
-            
-            # Separate bot and user messages
-            # User messages MUST have text OR media (voice, photo, video, document, sticker, etc.)
-            bot_messages = [m for m in messages if m['is_bot']]
-            user_messages = [m for m in messages if not m['is_bot'] and (m['text'] or m['has_media'])]
-            
-            # Log details for debugging
-            user_content_types = []
-            for m in user_messages:
-                if m['text']:
-                    user_content_types.append(f"text({len(m['text'])}ch)")
-                if m['has_media']:
-                    user_content_types.append(m['media_type'] or 'media')
             
-            print(f"[{datetime.now()}] Topic {topic_id}: {len(messages)} msgs total, "
-                  f"{len(bot_messages)} bot, {len(user_messages)} user with content: [{', '.join(user_content_types)}]")
-            
-            # Need at least 1 bot message (welcome) AND 1 user message WITH TEXT OR MEDIA
-            if not bot_messages:
-                print(f"[{datetime.now()}] Topic {topic_id}: no bot messages found")
-                return False
-            if not user_messages:
-                print(f"[{datetime.now()}] Topic {topic_id}: no user messages with content found")
-                return False
-            
-            # User message must come AFTER bot's welcome message (check first bot message)
-            first_bot_time = min(m['date'] for m in bot_messages)
-            user_msgs_after_bot = [m for m in user_messages if m['date'] > first_bot_time]
-            
-            if not user_msgs_after_bot:
-                print(f"[{datetime.now()}] Topic {topic_id}: no user message after bot welcome")
-                return False
-            
-            print(f"[{datetime.now()}] ✓ Valid conversation detected in topic {topic_id}: "
-                  f"{len(bot_messages)} bot + {len(user_msgs_after_bot)} user msgs after welcome")
-            return True
+            # Get recent messages from the topic. An idle General holds just the
+            # welcome, so a short page usually has the whole topic; only a full
+            # page can hide older messages, so fetch the bigger window then.
+            if probe:
+                result = await get_replies(REPLIES_PROBE_LIMIT)
+                if len(result.messages) < REPLIES_PROBE_LIMIT:
+                    return result.messages
+            result = await get_replies(REPLIES_FULL_LIMIT)
+            return result.messages
             
     except Exception as e:
-        print(f"[{datetime.now()}] Error checking messages in topic {topic_id}: {e}")
-        traceback.print_exc()
+        log.exception(f"Error fetching messages in topic {topic_id}: {e}")
+        invalidate_general(chat_id)  # Re-verify the topic on the next check
+        return []
+
+@dataclass(frozen=True, slots=True)
+class TopicMessage:
+    """One topic message, reduced to what the check and the naming need."""
+    from_id: int
+    date: int
+    is_bot: bool
+    text: str
+    has_media: bool
+    media_type: str
+    is_voice: bool
+    msg_id: int
+
+def parse_topic_messages(messages: list) -> list[TopicMessage]:
+    """Normalize raw topic messages once, for the check and the naming.
+    
+    Messages without a user sender (service messages) are dropped; order is kept.
+    """
+    parsed = []
+    for msg in messages:
+        if not hasattr(msg, 'from_id') or not hasattr(msg, 'date'):
+            continue
+            
+        from_id = getattr(msg.from_id, 'user_id', None)
+        if not from_id:
+            continue
+        
+        text, has_media, media_type = has_meaningful_content(msg)
+        
+        parsed.append(TopicMessage(
+            from_id=from_id,
+            date=msg.date,
+            is_bot=from_id == BOT_ID,
+            text=text,
+            has_media=has_media,
+            media_type=media_type,
+            is_voice=has_media and 'Voice' in type(msg.media).__name__,
+            msg_id=getattr(msg, 'id', 0)
+        ))
+    return parsed
+
+def has_user_message(messages: list[TopicMessage], topic_id: int) -> bool:
+    """Check if parsed topic messages form a valid conversation (no network).
+    
+    True only if:
+    - At least 2 messages total
+    - At least 1 bot message (welcome)
+    - At least 1 user message AFTER the bot's welcome (with text OR media like voice/photo)
+    """
+    # Need at least 2 messages total
+    if len(messages) < MIN_MESSAGES_FOR_AUTOTHREAD:
+        log.info(f"Topic {topic_id}: only {len(messages)} messages (need {MIN_MESSAGES_FOR_AUTOTHREAD})")
         return False
+    
+    # One pass over the messages: count bot messages and find the first (the
+    # welcome), and collect user message dates. Order doesn't matter, since
+    # "after the welcome" below compares dates.
+    # User messages MUST have text OR media (voice, photo, video, document, sticker, etc.)
+    bot_count = 0
+    first_bot_time = None
+    user_dates = []
+    user_content_types = []  # For the debug log line
+    for m in messages:
+        if m.is_bot:
+            bot_count += 1
+            if first_bot_time is None or m.date < first_bot_time:
+                first_bot_time = m.date
+        elif m.text or m.has_media:
+            user_dates.append(m.date)
+            if m.text:
+                user_content_types.append(f"text({len(m.text)}ch)")
+            if m.has_media:
+                user_content_types.append(m.media_type or 'media')
+    
+    log.info(f"Topic {topic_id}: {len(messages)} msgs total, "
+             f"{bot_count} bot, {len(user_dates)} user with content: [{', '.join(user_content_types)}]")
+    
+    # Need at least 1 bot message (welcome) AND 1 user message WITH TEXT OR MEDIA
+    if not bot_count:
+        log.info(f"Topic {topic_id}: no bot messages found")
+        return False
+    if not user_dates:
+        log.info(f"Topic {topic_id}: no user messages with content found")
+        return False
+    
+    # User message must come AFTER bot's welcome message (check first bot message)
+    users_after_bot = sum(1 for date in user_dates if date > first_bot_time)
+    
+    if not users_after_bot:
+        log.info(f"Topic {topic_id}: no user message after bot welcome")
+        return False
+    
+    log.info(f"✓ Valid conversation detected in topic {topic_id}: "
+             f"{bot_count} bot + {users_after_bot} user msgs after welcome")
+    return True
+
+def next_random_id() -> int:
+    """Return a CreateForumTopic random_id; it only has to be unique, so no CSPRNG syscall."""
+    return ((os.getpid() & 0xFFFF) << 32) | (next(_random_ids) & 0xFFFFFFFF)
+
+def extract_new_topic_id(create_result, random_id: int) -> int | None:
+    """Get a new topic's ID from a CreateForumTopic result, or None if it isn't there.
+    
+    The topic ID is the ID of the service message that opened the topic:
+    reported back in an UpdateMessageID carrying our random_id, and as the
+    MessageActionTopicCreate message in an UpdateNewChannelMessage.
+    """
+    updates = getattr(create_result, 'updates', [])
+    for update in updates:
+        if getattr(update, 'random_id', None) == random_id:
+            return update.id
+    for update in updates:
+        message = getattr(update, 'message', None)
+        if isinstance(getattr(message, 'action', None), types.MessageActionTopicCreate):
+            return message.id
+    return None
 
 async def trigger_auto_thread(chat_id: int, topic_id: int, topic_name: str):
     """Trigger auto-threading for a topic using the shared daemon client."""
-    from pyrogram.raw import functions
-    
     result = {"new_general_id": None, "renamed_topic_id": topic_id, "renamed_to": topic_name}
     
     async with get_pyrogram_client() as app:
-        peer = await app.resolve_peer(chat_id)
+        peer = await resolve_peer_cached(app, chat_id)
         
         # 1. Rename the current topic
         try:
@@ -322,28 +682,24 @@ async def trigger_auto_thread(chat_id: int, topic_id: int, topic_name: str):
                     title=topic_name
                 )
             )
-            print(f"✅ Renamed topic {topic_id} to: {topic_name}")
+            log.info(f"✅ Renamed topic {topic_id} to: {topic_name}")
         except Exception as e:
-            print(f"⚠️ Could not rename topic: {e}")
+            log.warning(f"⚠️ Could not rename topic: {e}")
+            invalidate_general(chat_id)  # It may have been closed or deleted
         
         # 2. Create new "General" topic
         try:
+            random_id = next_random_id()
             create_result = await app.invoke(
                 functions.channels.CreateForumTopic(
                     channel=peer,
                     title="General",
-                    random_id=int.from_bytes(os.urandom(4), 'big'),
+                    random_id=random_id,
                     icon_color=0x6FB9F0
                 )
             )
             
-            # Extract new topic ID
-            new_topic_id = None
-            for update in create_result.updates:
-                if hasattr(update, 'message') and hasattr(update.message, 'reply_to'):
-                    if hasattr(update.message.reply_to, 'forum_topic') and update.message.reply_to.forum_topic:
-                        new_topic_id = update.message.reply_to.reply_to_msg_id
-                        break
+            new_topic_id = extract_new_topic_id(create_result, random_id)
             
             if not new_topic_id:
                 # Fallback: find the newest General topic
@@ -357,171 +713,169 @@ async def trigger_auto_thread(chat_id: int, topic_id: int, topic_name: str):
                         new_topic_id = t.id
                         break
             
-            print(f"✅ Created new General topic with ID: {new_topic_id}")
+            log.info(f"✅ Created new General topic with ID: {new_topic_id}")
             result["new_general_id"] = new_topic_id
             
             # Update state
             if new_topic_id:
                 set_current_general_topic(chat_id, new_topic_id)
+                mark_general_verified(chat_id, new_topic_id)  # Just created, so known open
                 
         except Exception as e:
-            print(f"❌ Could not create new General topic: {e}")
-            traceback.print_exc()
+            log.exception(f"❌ Could not create new General topic: {e}")
     
     # Send welcome to new General with retry
     new_general_id = result.get("new_general_id")
     if new_general_id:
-        forum_config = MONITORED_FORUMS.get(chat_id, {})
-        welcome = forum_config.get("welcome_message", "👋 What's on your mind?")
+        welcome = message_payload(chat_id, new_general_id, _FORUMS.get(chat_id, _UNMONITORED).welcome_message)
         
         # Retry up to 3 times with exponential backoff
         for attempt in range(3):
             try:
-                resp = requests.post(
-                    f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-                    json={
-                        "chat_id": chat_id,
-                        "message_thread_id": new_general_id,
-                        "text": welcome
-                    },
-                    timeout=10
-                )
+                resp = await send_message(welcome)
                 if resp.ok:
-                    print(f"[{datetime.now()}] Sent welcome to new General (topic {new_general_id})")
+                    log.info(f"Sent welcome to new General (topic {new_general_id})")
                     break
                 elif resp.status_code == 429:  # Rate limited
                     retry_after = resp.json().get("parameters", {}).get("retry_after", 5)
-                    print(f"[{datetime.now()}] Rate limited, waiting {retry_after}s...")
+                    log.warning(f"Rate limited, waiting {retry_after}s...")
                     await asyncio.sleep(retry_after)
                 else:
-                    print(f"[{datetime.now()}] Failed to send welcome: {resp.text}")
+                    log.error(f"Failed to send welcome: {resp.text}")
                     break
             except Exception as e:
-                print(f"[{datetime.now()}] Welcome send attempt {attempt+1} failed: {e}")
+                log.warning(f"Welcome send attempt {attempt+1} failed: {e}")
+                if isinstance(e, requests.ConnectionError):
+                    new_http_session()  # Drop possibly dead pooled connections
                 if attempt < 2:
                     await asyncio.sleep(2 ** attempt)
     
     return result
 
-async def generate_topic_name(chat_id: int, topic_id: int) -> str:
-    """Generate a smart topic name from conversation content."""
+def iter_lines(text: str):
+    """Yield text's lines in order, stopping as soon as the caller does (no up-front split)."""
+    start = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+def name_from_messages(messages: list[TopicMessage]) -> str:
+    """Pick a smart topic name from parsed topic messages (no network)."""
+    # Collect text messages for analysis
+    user_texts = []
+    bot_texts = []
+    has_voice = False
+    
+    for m in messages:
+        # Check for voice messages
+        if m.is_voice:
+            has_voice = True
+        
+        if m.text:
+            if m.is_bot:
+                bot_texts.append(m.text)
+            else:
+                user_texts.append(m.text)
+    
+    # Smart title extraction
+    
+    # 1. Check user messages for clear topic/question
+    for text in user_texts:
+        # Skip greetings and short messages (texts are already stripped)
+        if len(text) <= 5 and text.lower() in _SKIP_TEXTS:
+            continue
+        # Questions make good titles
+        q_end = text.find('?')
+        if q_end != -1:
+            q = text[:q_end].strip() + '?'
+            if len(q) > 5:  # Avoid "?" alone
+                return q[:35] + ('...' if len(q) > 35 else '')
+        # Substantial text
+        if len(text) > 10:
+            first = _FIRST_SENTENCE_RE.match(text).group().strip()
+            if len(first) > 5:
+                return first[:35] + ('...' if len(first) > 35 else '')
+    
+    # 2. Extract topic from bot response (if substantial)
+    for text in bot_texts:
+        # Skip welcome messages
+        if text[:9].lower().startswith(_BOT_GREETING_PREFIXES):
+            continue
+        # Look for markdown headers or clear topics; an early match leaves
+        # the rest of a long response unsliced
+        for line in iter_lines(text):
+            line = line.strip()
+            header = _BOLD_HEADER_RE.match(line)
+            if header:
+                topic = header.group(1)
+                if len(topic) > 3:
+                    return topic[:35] + ('...' if len(topic) > 35 else '')
+            if len(line) > 15 and ':' in line[:30]:
+                topic = line.partition(':')[0].strip()
+                if len(topic) > 5 and not topic.lower().startswith(('http', 'note')):
+                    return topic[:35]
+    
+    # 3. Voice message fallback
+    if has_voice and not user_texts:
+        return f"Voice chat {datetime.now().strftime('%b %d %H:%M')}"
+    
+    # 4. Generic fallback
+    return f"Chat {datetime.now().strftime('%b %d %H:%M')}"
+
+async def generate_topic_name(chat_id: int, topic_id: int, messages: list[TopicMessage] = None) -> str:
+    """Generate a smart topic name from conversation content.
+    
+    Pass the parsed messages if they were already fetched; otherwise the
+    topic is fetched here.
+    """
+    if messages is None:
+        messages = parse_topic_messages(await fetch_topic_messages(chat_id, topic_id, probe=False))
+    return name_from_messages(messages)
+
+async def ensure_general_exists(chat_id: int, current_general: int) -> int:
+    """Ensure a General topic exists. Create one if missing/closed.
+    
+    current_general is the stored General id (see get_current_general),
+    which the caller has already read.
+    """
+    # Verified recently - skip the round trip (errors elsewhere invalidate this)
+    verified_id, valid_until = _general_valid_until.get(chat_id, (None, 0))
+    if verified_id == current_general and time.time() < valid_until:
+        return current_general
+    
     try:
         async with get_pyrogram_client() as app:
-            from pyrogram.raw import functions
-            peer = await app.resolve_peer(chat_id)
+            peer = await resolve_peer_cached(app, chat_id)
             
+            # Check if current General exists and is open - fetch just that topic.
+            # Deleted topics come back as ForumTopicDeleted, which has no title.
             result = await app.invoke(
-                functions.messages.GetReplies(
-                    peer=peer,
-                    msg_id=topic_id,
-                    offset_id=0,
-                    offset_date=0,
-                    add_offset=0,
-                    limit=15,
-                    max_id=0,
-                    min_id=0,
-                    hash=0
+                functions.channels.GetForumTopicsByID(
+                    channel=peer,
+                    topics=[current_general]
                 )
             )
+            current_topic = next((t for t in result.topics if t.id == current_general), None)
+            if (current_topic and getattr(current_topic, 'title', None) is not None
+                    and not getattr(current_topic, 'closed', False)):
+                mark_general_verified(chat_id, current_general)
+                return current_general  # All good
             
-            # Collect text messages for analysis
-            user_texts = []
-            bot_texts = []
-            has_voice = False
-            
-            for msg in result.messages:
-                from_id = getattr(getattr(msg, 'from_id', None), 'user_id', None)
-                text = getattr(msg, 'message', None)
-                media = getattr(msg, 'media', None)
-                
-                # Check for voice messages
-                if media and 'Voice' in type(media).__name__:
-                    has_voice = True
-                
-                if text:
-                    text = text.strip()
-                    if from_id == BOT_ID:
-                        bot_texts.append(text)
-                    elif from_id:
-                        user_texts.append(text)
-            
-            # Smart title extraction
-            
-            # 1. Check user messages for clear topic/question
-            for text in user_texts:
-                clean = text.lower().strip()
-                # Skip greetings and short messages
-                if clean in ['hi', 'hello', 'hey', 'yo', '?', 'test', 'ok', 'yes', 'no']:
-                    continue
-                # Questions make good titles
-                if '?' in text:
-                    q = text.split('?')[0].strip() + '?'
-                    if len(q) > 5:  # Avoid "?" alone
-                        return q[:35] + ('...' if len(q) > 35 else '')
-                # Substantial text
-                if len(text) > 10:
-                    first = text.split('\n')[0].split('.')[0].strip()
-                    if len(first) > 5:
-                        return first[:35] + ('...' if len(first) > 35 else '')
-            
-            # 2. Extract topic from bot response (if substantial)
-            for text in bot_texts:
-                # Skip welcome messages
-                if any(text.lower().startswith(w) for w in ['hey', 'hi', 'hello', '👋', "what's on"]):
-                    continue
-                # Look for markdown headers or clear topics
-                for line in text.split('\n'):
-                    line = line.strip()
-                    if line.startswith('**') and '**' in line[2:]:
-                        topic = line.split('**')[1]
-                        if len(topic) > 3:
-                            return topic[:35] + ('...' if len(topic) > 35 else '')
-                    if len(line) > 15 and ':' in line[:30]:
-                        topic = line.split(':')[0].strip()
-                        if len(topic) > 5 and not topic.lower().startswith(('http', 'note')):
-                            return topic[:35]
-            
-            # 3. Voice message fallback
-            if has_voice and not user_texts:
-                return f"Voice chat {datetime.now().strftime('%b %d %H:%M')}"
-            
-            # 4. Generic fallback
-            return f"Chat {datetime.now().strftime('%b %d %H:%M')}"
-            
-    except Exception as e:
-        print(f"[{datetime.now()}] Title generation error: {e}")
-        traceback.print_exc()
-        return f"Chat {datetime.now().strftime('%b %d %H:%M')}"
-
-async def ensure_general_exists(chat_id: int) -> int:
-    """Ensure a General topic exists. Create one if missing/closed."""
-    from pyrogram.raw import functions
-    
-    current_general = get_current_general(chat_id)
-    
-    try:
-        async with get_pyrogram_client() as app:
-            peer = await app.resolve_peer(chat_id)
-            
-            # Check if current General exists and is open
+            # Search for topics titled "General" server-side instead of listing them all
             result = await app.invoke(
                 functions.channels.GetForumTopics(
                     channel=peer,
                     offset_date=0,
                     offset_id=0,
                     offset_topic=0,
-                    limit=50
+                    limit=5,
+                    q="General"
                 )
             )
             
-            # Build topic lookup
-            topics_by_id = {topic.id: topic for topic in result.topics}
-            
-            # Check current general status
-            current_topic = topics_by_id.get(current_general)
-            if current_topic and not getattr(current_topic, 'closed', False):
-                return current_general  # All good
-            
             # Find any open topic named "General" - prefer the NEWEST one (highest ID)
             general_topics = [
                 topic for topic in result.topics 
@@ -531,7 +885,7 @@ async def ensure_general_exists(chat_id: int) -> int:
             if general_topics:
                 # Use the newest General topic
                 general_topic = max(general_topics, key=lambda t: t.id)
-                print(f"[{datetime.now()}] Found existing General topic: {general_topic.id}")
+                log.info(f"Found existing General topic: {general_topic.id}")
                 
                 # Update state
                 state = load_state(STATE_PATH)
@@ -539,13 +893,14 @@ async def ensure_general_exists(chat_id: int) -> int:
                     state[str(chat_id)] = {}
                 state[str(chat_id)]["general_topic_id"] = general_topic.id
                 save_state(STATE_PATH, state)
+                mark_general_verified(chat_id, general_topic.id)
                 return general_topic.id
             
             # Need to create a new General
-            print(f"[{datetime.now()}] No open General found, creating one...")
+            log.info("No open General found, creating one...")
             
             # Generate a unique random_id
-            random_id = int.from_bytes(os.urandom(4), 'big')
+            random_id = next_random_id()
             
             create_result = await app.invoke(
                 functions.channels.CreateForumTopic(
@@ -556,42 +911,35 @@ async def ensure_general_exists(chat_id: int) -> int:
                 )
             )
             
-            # Extract new topic ID from the result
-            # The result contains Updates with the new topic info
-            new_topic_id = None
-            
-            # Method 1: Check the result directly for topic info
-            if hasattr(create_result, 'updates'):
-                for update in create_result.updates:
-                    if hasattr(update, 'id'):
-                        # This might be the message ID in the topic
-                        pass
+            # Method 1: Read the new topic ID from the CreateForumTopic result
+            new_topic_id = extract_new_topic_id(create_result, random_id)
             
             # Method 2: Re-fetch topics and find the newest "General"
-            await asyncio.sleep(0.5)  # Brief wait for Telegram to propagate
-            
-            topics_result = await app.invoke(
-                functions.channels.GetForumTopics(
-                    channel=peer,
-                    offset_date=0,
-                    offset_id=0,
-                    offset_topic=0,
-                    limit=10
+            if not new_topic_id:
+                await asyncio.sleep(0.5)  # Brief wait for Telegram to propagate
+                
+                topics_result = await app.invoke(
+                    functions.channels.GetForumTopics(
+                        channel=peer,
+                        offset_date=0,
+                        offset_id=0,
+                        offset_topic=0,
+                        limit=10
+                    )
                 )
-            )
-            
-            # Find the newest open General topic (should be the one we just created)
-            general_topics = [
-                topic for topic in topics_result.topics
-                if getattr(topic, 'title', '') == "General" and not getattr(topic, 'closed', False)
-            ]
-            
-            if general_topics:
-                new_topic = max(general_topics, key=lambda t: t.id)
-                new_topic_id = new_topic.id
+                
+                # Find the newest open General topic (should be the one we just created)
+                general_topics = [
+                    topic for topic in topics_result.topics
+                    if getattr(topic, 'title', '') == "General" and not getattr(topic, 'closed', False)
+                ]
+                
+                if general_topics:
+                    new_topic = max(general_topics, key=lambda t: t.id)
+                    new_topic_id = new_topic.id
             
             if new_topic_id:
-                print(f"[{datetime.now()}] Created new General: topic {new_topic_id}")
+                log.info(f"Created new General: topic {new_topic_id}")
                 
                 # Update forum state
                 state = load_state(STATE_PATH)
@@ -599,32 +947,23 @@ async def ensure_general_exists(chat_id: int) -> int:
                     state[str(chat_id)] = {}
                 state[str(chat_id)]["general_topic_id"] = new_topic_id
                 save_state(STATE_PATH, state)
+                mark_general_verified(chat_id, new_topic_id)
                 
                 # Track creation time in daemon_state for anti-race protection
                 daemon_state = get_daemon_state()
-                if "created_topics" not in daemon_state:
-                    daemon_state["created_topics"] = {}
-                daemon_state["created_topics"][f"{chat_id}:{new_topic_id}"] = {
+                remember(daemon_state.setdefault("created_topics", {}), f"{chat_id}:{new_topic_id}", {
+                    "ts": time.time(),
                     "timestamp": datetime.now().isoformat(),
                     "source": "ensure_general_exists"
-                }
+                })
                 save_daemon_state(daemon_state)
                 
                 # Send welcome with retry
-                forum_config = MONITORED_FORUMS.get(chat_id, {})
-                welcome = forum_config.get("welcome_message", "👋 What's on your mind?")
+                welcome = message_payload(chat_id, new_topic_id, _FORUMS.get(chat_id, _UNMONITORED).welcome_message)
                 
                 for attempt in range(3):
                     try:
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-                            json={
-                                "chat_id": chat_id,
-                                "message_thread_id": new_topic_id,
-                                "text": welcome
-                            },
-                            timeout=10
-                        )
+                        resp = await send_message(welcome)
                         if resp.ok:
                             break
                         elif resp.status_code == 429:
@@ -633,34 +972,53 @@ async def ensure_general_exists(chat_id: int) -> int:
                         else:
                             break
                     except Exception as e:
+                        if isinstance(e, requests.ConnectionError):
+                            new_http_session()  # Drop possibly dead pooled connections
                         if attempt < 2:
                             await asyncio.sleep(2 ** attempt)
                 
                 return new_topic_id
             else:
-                print(f"[{datetime.now()}] Warning: Created General but couldn't find it")
+                log.warning("Created General but couldn't find it")
             
             return current_general  # Fallback
             
     except Exception as e:
-        print(f"[{datetime.now()}] Error ensuring General exists: {e}")
-        traceback.print_exc()
+        log.exception(f"Error ensuring General exists: {e}")
+        invalidate_general(chat_id)  # Unknown state - verify again next tick
         return current_general
 
+def in_global_cooldown(daemon_state: dict) -> bool:
+    """Anti-race safeguard 3: whether any forum auto-threaded too recently."""
+    last_autothread = daemon_state.get("last_autothread_ts") or daemon_state.get("last_autothread_timestamp")
+    if last_autothread:
+        age_seconds = time.time() - entry_time(last_autothread)
+        if age_seconds < COOLDOWN_AFTER_AUTOTHREAD_SECONDS:
+            log.info(f"Skipping - global cooldown: {age_seconds:.0f}s since last auto-thread (need {COOLDOWN_AFTER_AUTOTHREAD_SECONDS}s)")
+            return True
+    return False
+
 async def check_and_autothread_forum(chat_id: int):
     """Check a forum and auto-thread if needed."""
-    # Use lock to prevent concurrent runs
-    async with _daemon_lock:
+    # Use lock to prevent concurrent runs on this forum
+    lock = _forum_locks.setdefault(chat_id, asyncio.Lock())
+    async with lock:
         return await _check_and_autothread_forum_impl(chat_id)
 
 async def _check_and_autothread_forum_impl(chat_id: int):
-    """Internal implementation - must be called with _daemon_lock held."""
-    # First ensure General exists
-    current_general = await ensure_general_exists(chat_id)
+    """Internal implementation - must be called with the forum's lock held."""
+    persistent_topics = _FORUMS.get(chat_id, _UNMONITORED).persistent_topics
+    
+    # Cheap check first: if the stored General is a persistent topic (like
+    # "Main"), there is nothing to do - don't spend an RPC verifying it
+    current_general = get_current_general(chat_id)
+    if current_general in persistent_topics:
+        return False
+    
+    # Ensure General exists
+    current_general = await ensure_general_exists(chat_id, current_general)
     
     # Skip if current General is a persistent topic (like "Main")
-    forum_config = MONITORED_FORUMS.get(chat_id, {})
-    persistent_topics = forum_config.get("persistent_topics", [])
     if current_general in persistent_topics:
         return False  # Don't auto-thread persistent topics
     
@@ -676,78 +1034,72 @@ async def _check_and_autothread_forum_impl(chat_id: int):
     
     # Anti-race safeguard 1: Check if this topic was recently created
     created_key = f"{chat_id}:{current_general}"
+    now = time.time()
     created_info = daemon_state.get("created_topics", {}).get(created_key)
     if created_info:
-        try:
-            created_time = datetime.fromisoformat(created_info.get("timestamp", ""))
-            age_seconds = (datetime.now() - created_time).total_seconds()
-            if age_seconds < COOLDOWN_AFTER_CREATE_SECONDS:
-                print(f"[{datetime.now()}] Skipping topic {current_general} - created {age_seconds:.0f}s ago (cooldown: {COOLDOWN_AFTER_CREATE_SECONDS}s)")
-                return False
-        except (ValueError, TypeError):
-            pass
+        age_seconds = now - entry_time(created_info)
+        if age_seconds < COOLDOWN_AFTER_CREATE_SECONDS:
+            log.info(f"Skipping topic {current_general} - created {age_seconds:.0f}s ago (cooldown: {COOLDOWN_AFTER_CREATE_SECONDS}s)")
+            return False
     
     # Anti-race safeguard 2: Check if this topic was created as new_general from auto-threading
-    for key, data in daemon_state.get("processed", {}).items():
-        if data.get("new_general") == current_general:
-            created_at = data.get("timestamp", "")
-            if created_at:
-                try:
-                    created_time = datetime.fromisoformat(created_at)
-                    age_seconds = (datetime.now() - created_time).total_seconds()
-                    if age_seconds < COOLDOWN_AFTER_CREATE_SECONDS:
-                        print(f"[{datetime.now()}] Skipping topic {current_general} - auto-threaded {age_seconds:.0f}s ago (cooldown: {COOLDOWN_AFTER_CREATE_SECONDS}s)")
-                        return False
-                except (ValueError, TypeError):
-                    pass
+    created_at = daemon_state.get("new_general_index", {}).get(created_key)
+    if created_at:
+        age_seconds = now - entry_time(created_at)
+        if age_seconds < COOLDOWN_AFTER_CREATE_SECONDS:
+            log.info(f"Skipping topic {current_general} - auto-threaded {age_seconds:.0f}s ago (cooldown: {COOLDOWN_AFTER_CREATE_SECONDS}s)")
+            return False
     
-    # Anti-race safeguard 3: Global cooldown after any auto-threading
-    last_autothread = daemon_state.get("last_autothread_timestamp")
-    if last_autothread:
-        try:
-            last_time = datetime.fromisoformat(last_autothread)
-            age_seconds = (datetime.now() - last_time).total_seconds()
-            if age_seconds < COOLDOWN_AFTER_AUTOTHREAD_SECONDS:
-                print(f"[{datetime.now()}] Skipping - global cooldown: {age_seconds:.0f}s since last auto-thread (need {COOLDOWN_AFTER_AUTOTHREAD_SECONDS}s)")
-                return False
-        except (ValueError, TypeError):
-            pass
+    # Anti-race safeguard 3: Global cooldown after any auto-threading (cheap
+    # early exit; it is checked again under _autothread_lock below)
+    if in_global_cooldown(daemon_state):
+        return False
     
     # Check if there's a conversation in current General
-    has_conversation = await check_for_user_message_mtproto(chat_id, current_general)
+    messages = parse_topic_messages(await fetch_topic_messages(chat_id, current_general))
     
-    if has_conversation:
-        print(f"[{datetime.now()}] Conversation detected in General (topic {current_general})")
+    if has_user_message(messages, current_general):
+        log.info(f"Conversation detected in General (topic {current_general})")
         
-        # Generate topic name
-        topic_name = await generate_topic_name(chat_id, current_general)
-        print(f"[{datetime.now()}] Generated name: {topic_name}")
+        # Generate topic name from the messages the check already fetched
+        topic_name = await generate_topic_name(chat_id, current_general, messages)
+        log.info(f"Generated name: {topic_name}")
         
-        # Trigger auto-threading
-        result = await trigger_auto_thread(chat_id, current_general, topic_name)
-        print(f"[{datetime.now()}] Auto-threaded: {result}")
+        # Per-forum locks let other forums run meanwhile, so re-check the
+        # global cooldown and stamp it without releasing the lock in between
+        async with _autothread_lock:
+            if in_global_cooldown(daemon_state):
+                return False
+            
+            # Trigger auto-threading
+            result = await trigger_auto_thread(chat_id, current_general, topic_name)
+            log.info(f"Auto-threaded: {result}")
+            
+            # Set global cooldown timestamp
+            now = time.time()
+            now_iso = datetime.now().isoformat()  # Human-readable copy; checks use "ts"
+            daemon_state["last_autothread_ts"] = now
+            daemon_state["last_autothread_timestamp"] = now_iso
         
-        # Mark as processed and set global cooldown
-        if "processed" not in daemon_state:
-            daemon_state["processed"] = {}
-        daemon_state["processed"][processed_key] = {
-            "timestamp": datetime.now().isoformat(),
+        # Mark as processed
+        remember(daemon_state.setdefault("processed", {}), processed_key, {
+            "ts": now,
+            "timestamp": now_iso,
             "renamed_to": topic_name,
             "new_general": result.get("new_general_id")
-        }
+        })
         
         # Also track the new general in created_topics for consistent cooldown handling
         new_general_id = result.get("new_general_id")
         if new_general_id:
-            if "created_topics" not in daemon_state:
-                daemon_state["created_topics"] = {}
-            daemon_state["created_topics"][f"{chat_id}:{new_general_id}"] = {
-                "timestamp": datetime.now().isoformat(),
+            # Reverse index for anti-race safeguard 2 (new general -> when it was made)
+            daemon_state.setdefault("new_general_index", {})[f"{chat_id}:{new_general_id}"] = now
+
+            remember(daemon_state.setdefault("created_topics", {}), f"{chat_id}:{new_general_id}", {
+                "ts": now,
+                "timestamp": now_iso,
                 "source": "auto_thread"
-            }
-        
-        # Set global cooldown timestamp
-        daemon_state["last_autothread_timestamp"] = datetime.now().isoformat()
+            })
         
         save_daemon_state(daemon_state)
         
@@ -755,53 +1107,114 @@ async def _check_and_autothread_forum_impl(chat_id: int):
     
     return False
 
-async def run_once():
-    """Run a single check across all monitored forums."""
-    for chat_id in MONITORED_FORUMS:
+async def run_once() -> bool:
+    """Run a single check across all monitored forums, checking them concurrently.
+    
+    Returns True if any forum was auto-threaded.
+    """
+    if len(MONITORED_FORUMS) == 1:
+        # Common setup: nothing to fan out, check the forum directly
+        chat_id = next(iter(MONITORED_FORUMS))
         try:
-            await check_and_autothread_forum(chat_id)
+            return bool(await check_and_autothread_forum(chat_id))
         except Exception as e:
-            print(f"[{datetime.now()}] Error checking {chat_id}: {e}")
-            traceback.print_exc()
+            log.exception(f"Error checking {chat_id}: {e}")
+            return False
+    
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FORUMS)
+    
+    async def check(chat_id):
+        async with semaphore:
+            return await check_and_autothread_forum(chat_id)
+    
+    chat_ids = list(MONITORED_FORUMS)
+    results = await asyncio.gather(*(check(chat_id) for chat_id in chat_ids), return_exceptions=True)
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            log.error(f"Error checking {chat_id}: {result}", exc_info=result)
+    return any(result is True for result in results)
 
 async def run_daemon(interval: int = 30):
-    """Run continuously, checking every interval seconds."""
-    print(f"[{datetime.now()}] Auto-threading daemon started (interval: {interval}s)")
-    print(f"[{datetime.now()}] Monitoring forums: {list(MONITORED_FORUMS.keys())}")
-    print(f"[{datetime.now()}] Settings: create_cooldown={COOLDOWN_AFTER_CREATE_SECONDS}s, "
-          f"autothread_cooldown={COOLDOWN_AFTER_AUTOTHREAD_SECONDS}s, min_msgs={MIN_MESSAGES_FOR_AUTOTHREAD}")
+    """Run continuously: on each new message, else every interval seconds (backing off while idle)."""
+    log.info(f"Auto-threading daemon started (interval: {interval}s)")
+    log.info(f"Monitoring forums: {list(MONITORED_FORUMS.keys())}")
+    log.info(f"Settings: create_cooldown={COOLDOWN_AFTER_CREATE_SECONDS}s, "
+             f"autothread_cooldown={COOLDOWN_AFTER_AUTOTHREAD_SECONDS}s, min_msgs={MIN_MESSAGES_FOR_AUTOTHREAD}")
     
+    # systemd stops us with SIGTERM: cancel the loop so the finally block flushes state
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    
+    sleep_for = interval
     try:
         while True:
+            _wakeup.clear()
             try:
-                await run_once()
+                did_work = await run_once()
             except Exception as e:
-                print(f"[{datetime.now()}] Daemon error: {e}")
-                traceback.print_exc()
+                log.exception(f"Daemon error: {e}")
+                did_work = False
             
-            await asyncio.sleep(interval)
+            # Idle forums get polled less and less often; new messages still
+            # wake us immediately, so this only stretches the fallback poll
+            if did_work:
+                sleep_for = interval
+            else:
+                sleep_for = min(sleep_for * IDLE_BACKOFF_FACTOR, max(interval, MAX_IDLE_INTERVAL_SECONDS))
+            
+            # Sleep until the next tick, or until a new forum message arrives
+            timeout = sleep_for if did_work else sleep_for + random.uniform(0, IDLE_JITTER_SECONDS)
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=timeout)
+                sleep_for = interval  # Activity: back to the base interval
+            except asyncio.TimeoutError:
+                pass
     finally:
-        # Clean shutdown
+        # Clean shutdown: let an in-flight debounced write land first, so the
+        # final flush can't race it or be overwritten by older data
+        if _flush_task is not None and not _flush_task.done():
+            await _flush_task
+        flush_daemon_state()
         await shutdown_client()
-        print(f"[{datetime.now()}] Daemon shutdown complete")
+        close_http_session()
+        log.info("Daemon shutdown complete")
+
+def setup_logging() -> QueueListener:
+    """Route log records through a queue so the event loop never blocks on stdout."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+    
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler)
+    logging.getLogger().addHandler(QueueHandler(records))
+    # INFO for our own logger only; the root stays at WARNING so library chatter is dropped
+    log.setLevel(logging.INFO)
+    listener.start()
+    return listener
 
 def main():
     parser = argparse.ArgumentParser(description="Auto-threading daemon")
     parser.add_argument("--daemon", action="store_true", help="Run as daemon")
     parser.add_argument("--once", action="store_true", help="Run once and exit")
-    parser.add_argument("--interval", type=int, default=30, help="Check interval in seconds")
+    parser.add_argument("--interval", type=int, default=30, help="Base fallback check interval in seconds; backs off to 300s while idle (new messages trigger a check immediately)")
     
     args = parser.parse_args()
     
-    if args.daemon:
-        try:
-            asyncio.run(run_daemon(args.interval))
-        except KeyboardInterrupt:
-            print(f"\n[{datetime.now()}] Interrupted by user")
-    elif args.once:
-        asyncio.run(run_once())
-    else:
-        parser.print_help()
+    listener = setup_logging()
+    try:
+        if args.daemon:
+            try:
+                asyncio.run(run_daemon(args.interval))
+            except KeyboardInterrupt:
+                log.info("Interrupted by user")
+            except asyncio.CancelledError:
+                log.info("Stopped")
+        elif args.once:
+            asyncio.run(run_once())
+            flush_daemon_state()
+        else:
+            parser.print_help()
+    finally:
+        listener.stop()  # Drains any queued records before exit
 
 if __name__ == "__main__":
     main()
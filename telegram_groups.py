@@ -16,41 +16,126 @@ Usage:
 
 import asyncio
 import argparse
-import json
 import os
+import random
+import sqlite3
+from contextlib import asynccontextmanager
 from pathlib import Path
 
+import pyrogram
+from pyrogram import Client, utils
+from pyrogram.enums import ChatType
+from pyrogram.raw import functions, types
+from pyrogram.storage import FileStorage
+
+from add_allowed_group import add_group, dump_json, load_json, trigger_reload
+
 # Session and config paths
 CONFIG_DIR = Path(__file__).parent
 SESSION_PATH = CONFIG_DIR / "clawd_userbot"
 CONFIG_PATH = CONFIG_DIR / "config.json"
 
+# Pyrogram release TunedFileStorage.open was copied from; other versions use plain FileStorage
+TUNED_STORAGE_PYROGRAM = "2.0.106"
 
-def load_config():
-    """Load API credentials from config."""
-    if CONFIG_PATH.exists():
-        with open(CONFIG_PATH) as f:
-            return json.load(f)
-    return {}
+# Resolved input peers per chat_id, so chained commands resolve each chat once
+_peer_cache = {}
 
+# Parsed config.json as (st_mtime_ns, st_size, data), see load_config
+_config_cache = None
 
-def save_config(config):
-    """Save API credentials to config."""
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
 
-
-async def authenticate(api_id: int, api_hash: str):
-    """Authenticate with Telegram (one-time setup)."""
-    from pyrogram import Client
+class TunedFileStorage(FileStorage):
+    """Session storage for short CLI runs: no VACUUM on every open.
     
-    save_config({"api_id": api_id, "api_hash": api_hash})
+    SQLite's default journaling and fsyncs are left alone - the session
+    file holds the account's auth key.
+    
+    open() mirrors FileStorage.open of TUNED_STORAGE_PYROGRAM minus the
+    VACUUM; make_client only uses it on that exact Pyrogram version.
+    """
     
+    async def open(self):
+        file_exists = self.database.is_file()
+        
+        self.conn = sqlite3.connect(str(self.database), timeout=1, check_same_thread=False)
+        
+        if not file_exists:
+            self.create()
+        else:
+            self.update()
+
+
+def make_client(api_id: int, api_hash: str):
+    """Build the userbot client on the tuned session storage."""
     app = Client(
         str(SESSION_PATH),
         api_id=api_id,
         api_hash=api_hash
     )
+    if pyrogram.__version__ == TUNED_STORAGE_PYROGRAM:
+        app.storage = TunedFileStorage(app.name, app.workdir)
+    return app
+
+
+async def resolve_cached(app, chat_id: int):
+    """Resolve a chat's input peer, memoized for the rest of the run."""
+    peer = _peer_cache.get(chat_id)
+    if peer is None:
+        peer = _peer_cache[chat_id] = await app.resolve_peer(chat_id)
+    return peer
+
+
+def load_config():
+    """Load API credentials from config, re-parsing only when the file changed."""
+    global _config_cache
+    try:
+        st = CONFIG_PATH.stat()
+    except FileNotFoundError:
+        return {}
+    key = (st.st_mtime_ns, st.st_size)
+    if _config_cache and _config_cache[:2] == key:
+        return _config_cache[2]
+    config = load_json(CONFIG_PATH.read_bytes())
+    _config_cache = (*key, config)
+    return config
+
+
+def save_config(config):
+    """Save API credentials to config atomically (write a temp file, then rename over)."""
+    global _config_cache
+    tmp_path = CONFIG_PATH.with_suffix(f'.json.{os.getpid()}.tmp')  # Per-process, so concurrent runs can't share it
+    try:
+        tmp_path.write_bytes(dump_json(config, indent=True))
+        os.replace(tmp_path, CONFIG_PATH)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    # Write-through: seed the cache rather than re-parsing on the next load
+    st = CONFIG_PATH.stat()
+    _config_cache = (st.st_mtime_ns, st.st_size, config)
+
+
+@asynccontextmanager
+async def session():
+    """Start the userbot client and yield it; all commands of one CLI run share it."""
+    config = load_config()
+    if not config:
+        print("❌ Not authenticated. Run: python telegram_groups.py auth --api-id X --api-hash Y")
+        raise SystemExit(1)
+    
+    app = make_client(config["api_id"], config["api_hash"])
+    
+    async with app:
+        yield app
+
+
+async def authenticate(api_id: int, api_hash: str):
+    """Authenticate with Telegram (one-time setup)."""
+    save_config({"api_id": api_id, "api_hash": api_hash})
+    
+    app = make_client(api_id, api_hash)
     
     async with app:
         me = await app.get_me()
@@ -60,199 +145,214 @@ async def authenticate(api_id: int, api_hash: str):
     return True
 
 
-async def create_forum_group(title: str, invite_bot: str = None, add_to_clawdbot: bool = True):
+async def enable_forum(app, chat_id: int):
+    """Turn on forum/topics for a supergroup via the raw API."""
+    try:
+        await app.invoke(
+            functions.channels.ToggleForum(
+                channel=await resolve_cached(app, chat_id),
+                enabled=True
+            )
+        )
+        print(f"✅ Enabled forum mode")
+    except Exception as e:
+        print(f"⚠️ Forum mode note: {e}")
+
+
+async def invite_to_group(app, chat_id: int, invite_bot: str):
+    """Invite a bot (or user) to the group."""
+    try:
+        await app.add_chat_members(chat_id, invite_bot)
+        print(f"✅ Invited {invite_bot} to the group")
+    except Exception as e:
+        print(f"⚠️ Could not invite bot: {e}")
+
+
+def add_to_clawdbot_allowlist(chat_id: int, title: str):
+    """Add the group to Clawdbot's allowlist and have Clawdbot reload it."""
+    try:
+        added = add_group(str(chat_id), title)
+        if added:
+            trigger_reload()
+            print(f"✅ Added to Clawdbot allowlist")
+    except Exception as e:
+        print(f"⚠️ Could not add to Clawdbot allowlist: {e}")
+
+
+async def create_forum_group(app, title: str, invite_bot: str = None, add_to_clawdbot: bool = True):
     """Create a forum-enabled supergroup."""
-    from pyrogram import Client
-    
-    config = load_config()
-    if not config:
-        print("❌ Not authenticated. Run: python telegram_groups.py auth --api-id X --api-hash Y")
-        return None
-    
-    app = Client(
-        str(SESSION_PATH),
-        api_id=config["api_id"],
-        api_hash=config["api_hash"]
+    # Create supergroup, asking for forum mode up front
+    result = await app.invoke(
+        functions.channels.CreateChannel(
+            title=title,
+            about="",
+            megagroup=True,
+            forum=True
+        )
     )
+    channel = result.chats[0]
+    chat_id = utils.get_channel_id(channel.id)
+    _peer_cache[chat_id] = types.InputPeerChannel(channel_id=channel.id, access_hash=channel.access_hash)
+    print(f"✅ Created supergroup: {title} (ID: {chat_id})")
     
-    async with app:
-        # Create supergroup
-        chat = await app.create_supergroup(title)
-        print(f"✅ Created supergroup: {title} (ID: {chat.id})")
-        
-        # Enable forum/topics via raw API
-        from pyrogram.raw import functions, types
-        try:
-            await app.invoke(
-                functions.channels.ToggleForum(
-                    channel=await app.resolve_peer(chat.id),
-                    enabled=True
-                )
-            )
-            print(f"✅ Enabled forum mode")
-        except Exception as e:
-            print(f"⚠️ Forum mode note: {e}")
-        
-        # Invite bot if specified
-        if invite_bot:
-            try:
-                await app.add_chat_members(chat.id, invite_bot)
-                print(f"✅ Invited {invite_bot} to the group")
-            except Exception as e:
-                print(f"⚠️ Could not invite bot: {e}")
-        
-        # Add to Clawdbot allowlist
-        if add_to_clawdbot:
-            try:
-                from add_allowed_group import add_group, trigger_reload
-                added = add_group(str(chat.id), title)
-                if added:
-                    trigger_reload()
-                    print(f"✅ Added to Clawdbot allowlist")
-            except Exception as e:
-                print(f"⚠️ Could not add to Clawdbot allowlist: {e}")
-        
-        return {"id": chat.id, "title": title}
+    # The remaining steps only need the chat id and each handles its own
+    # errors, so run them side by side rather than one round trip at a time
+    steps = []
+    if not getattr(channel, 'forum', False):
+        steps.append(enable_forum(app, chat_id))  # Server didn't honour forum=True
+    if invite_bot:
+        steps.append(invite_to_group(app, chat_id, invite_bot))
+    if add_to_clawdbot:
+        steps.append(asyncio.to_thread(add_to_clawdbot_allowlist, chat_id, title))
+    await asyncio.gather(*steps)
+    
+    return {"id": chat_id, "title": title}
 
 
-async def create_topic(chat_id: int, name: str):
+async def create_topic(app, chat_id: int, name: str):
     """Create a topic in a forum group."""
-    from pyrogram import Client
+    random_id = random.getrandbits(63)  # Only needs to be unique, not secret
+    result = await app.invoke(
+        functions.channels.CreateForumTopic(
+            channel=await resolve_cached(app, chat_id),
+            title=name,
+            random_id=random_id
+        )
+    )
     
-    config = load_config()
-    app = Client(
-        str(SESSION_PATH),
-        api_id=config["api_id"],
-        api_hash=config["api_hash"]
+    # Extract topic ID from updates: it is the ID of the service message that
+    # opened the topic, reported in the UpdateMessageID carrying our random_id
+    topic_id = next(
+        (u.id for u in result.updates if isinstance(u, types.UpdateMessageID) and u.random_id == random_id),
+        None
     )
     
-    async with app:
-        from pyrogram.raw import functions, types
-        
-        result = await app.invoke(
-            functions.channels.CreateForumTopic(
-                channel=await app.resolve_peer(chat_id),
-                title=name,
-                random_id=int.from_bytes(os.urandom(4), 'big')
-            )
+    if topic_id is None:
+        # Fallback: the service message itself
+        topic_id = next(
+            (u.message.id for u in result.updates if isinstance(u, types.UpdateNewChannelMessage)),
+            "unknown"
         )
-        
-        # Extract topic ID from updates
-        topic_id = None
-        for update in result.updates:
-            if hasattr(update, 'id'):
-                topic_id = update.id
-                break
-            elif hasattr(update, 'message') and hasattr(update.message, 'id'):
-                topic_id = update.message.id
-                break
-        
-        if topic_id is None:
-            # Fallback: get from first update's message_id
-            topic_id = result.updates[0].id if hasattr(result.updates[0], 'id') else "unknown"
-        
-        print(f"✅ Created topic '{name}' (ID: {topic_id}) in chat {chat_id}")
-        return {"topic_id": topic_id, "name": name, "chat_id": chat_id}
+    
+    print(f"✅ Created topic '{name}' (ID: {topic_id}) in chat {chat_id}")
+    return {"topic_id": topic_id, "name": name, "chat_id": chat_id}
+
+
+def peer_key(peer) -> tuple:
+    """Identity of an input peer, ignoring its access hash."""
+    peer_id = getattr(peer, 'channel_id', None) or getattr(peer, 'chat_id', None) or getattr(peer, 'user_id', None)
+    return type(peer), peer_id
 
 
-async def add_to_folder(chat_id: int, folder_name: str):
+async def add_to_folder(app, chat_id: int, folder_name: str):
     """Add a chat to a folder (creates folder if doesn't exist)."""
-    from pyrogram import Client
-    
-    config = load_config()
-    app = Client(
-        str(SESSION_PATH),
-        api_id=config["api_id"],
-        api_hash=config["api_hash"]
+    return await add_many_to_folder(app, [chat_id], folder_name)
+
+
+async def add_many_to_folder(app, chat_ids: list, folder_name: str):
+    """Add chats to a folder with a single folder update (creates folder if doesn't exist)."""
+    # Get existing folders, resolving the chats in the meantime
+    result, new_peers = await asyncio.gather(
+        app.invoke(functions.messages.GetDialogFilters()),
+        asyncio.gather(*(resolve_cached(app, chat_id) for chat_id in chat_ids))
     )
+    added = "chat" if len(chat_ids) == 1 else f"{len(chat_ids)} chats"
     
-    async with app:
-        from pyrogram.raw import functions, types
-        
-        # Get existing folders
-        result = await app.invoke(functions.messages.GetDialogFilters())
-        
-        # Handle different response types
-        filters = result.filters if hasattr(result, 'filters') else result
-        
-        # Find or create folder
-        folder_id = None
-        existing_filter = None
-        for f in filters:
-            if hasattr(f, 'title') and f.title == folder_name:
-                folder_id = f.id
-                existing_filter = f
-                break
-        
-        if folder_id is None:
-            # Create new folder
-            new_id = max([f.id for f in filters if hasattr(f, 'id')], default=1) + 1
-            await app.invoke(
-                functions.messages.UpdateDialogFilter(
+    # Handle different response types
+    filters = result.filters if hasattr(result, 'filters') else result
+    
+    # Find or create folder
+    folder_id = None
+    existing_filter = None
+    for f in filters:
+        if hasattr(f, 'title') and f.title == folder_name:
+            folder_id = f.id
+            existing_filter = f
+            break
+    
+    if folder_id is None:
+        # Create new folder
+        new_id = max([f.id for f in filters if hasattr(f, 'id')], default=1) + 1
+        await app.invoke(
+            functions.messages.UpdateDialogFilter(
+                id=new_id,
+                filter=types.DialogFilter(
                     id=new_id,
-                    filter=types.DialogFilter(
-                        id=new_id,
-                        title=folder_name,
-                        pinned_peers=[],
-                        include_peers=[await app.resolve_peer(chat_id)],
-                        exclude_peers=[],
-                        contacts=False,
-                        non_contacts=False,
-                        groups=True,
-                        broadcasts=False,
-                        bots=False,
-                        exclude_muted=False,
-                        exclude_read=False,
-                        exclude_archived=False,
-                    )
+                    title=folder_name,
+                    pinned_peers=[],
+                    include_peers=list(new_peers),
+                    exclude_peers=[],
+                    contacts=False,
+                    non_contacts=False,
+                    groups=True,
+                    broadcasts=False,
+                    bots=False,
+                    exclude_muted=False,
+                    exclude_read=False,
+                    exclude_archived=False,
                 )
             )
-            print(f"✅ Created folder '{folder_name}' and added chat")
-        else:
-            # Add chat to existing folder
-            new_peer = await app.resolve_peer(chat_id)
-            include_peers = list(existing_filter.include_peers) + [new_peer]
-            await app.invoke(
-                functions.messages.UpdateDialogFilter(
-                    id=folder_id,
-                    filter=types.DialogFilter(
-                        id=folder_id,
-                        title=folder_name,
-                        pinned_peers=list(existing_filter.pinned_peers) if existing_filter.pinned_peers else [],
-                        include_peers=include_peers,
-                        exclude_peers=list(existing_filter.exclude_peers) if existing_filter.exclude_peers else [],
-                        contacts=existing_filter.contacts,
-                        non_contacts=existing_filter.non_contacts,
-                        groups=existing_filter.groups,
-                        broadcasts=existing_filter.broadcasts,
-                        bots=existing_filter.bots,
-                        exclude_muted=existing_filter.exclude_muted,
-                        exclude_read=existing_filter.exclude_read,
-                        exclude_archived=existing_filter.exclude_archived,
-                    )
-                )
-            )
-            print(f"✅ Added chat to existing folder '{folder_name}'")
+        )
+        print(f"✅ Created folder '{folder_name}' and added {added}")
+    else:
+        # Add chats to existing folder, unless they are all in it already
+        included = {peer_key(p) for p in existing_filter.include_peers}
+        missing = {peer_key(p): p for p in new_peers if peer_key(p) not in included}
+        if not missing:
+            print(f"✅ Already in folder '{folder_name}'")
+            return True
         
-        return True
+        added = "chat" if len(missing) == 1 else f"{len(missing)} chats"
+        # Send the fetched filter back with the new peers; every other field
+        # (flags, pinned/excluded peers, emoticon) is kept as Telegram has it
+        existing_filter.include_peers = list(existing_filter.include_peers) + list(missing.values())
+        await app.invoke(
+            functions.messages.UpdateDialogFilter(
+                id=folder_id,
+                filter=existing_filter
+            )
+        )
+        print(f"✅ Added {added} to existing folder '{folder_name}'")
+    
+    return True
 
 
-async def list_groups():
+async def list_groups(app):
     """List all groups/chats."""
-    from pyrogram import Client
+    group_types = (ChatType.GROUP, ChatType.SUPERGROUP)  # Enum members, not strings
+    chats = [dialog.chat async for dialog in app.get_dialogs()]
     
-    config = load_config()
-    app = Client(
-        str(SESSION_PATH),
-        api_id=config["api_id"],
-        api_hash=config["api_hash"]
-    )
+    lines = [
+        f"{'📂' if getattr(chat, 'is_forum', False) else '💬'} {chat.title} (ID: {chat.id})"
+        for chat in chats
+        if chat.type in group_types
+    ]
     
-    async with app:
-        async for dialog in app.get_dialogs():
-            if dialog.chat.type in ["group", "supergroup"]:
-                forum = "📂" if getattr(dialog.chat, 'is_forum', False) else "💬"
-                print(f"{forum} {dialog.chat.title} (ID: {dialog.chat.id})")
+    # Print once all pages are in, rather than between GetDialogs round trips
+    if lines:
+        print("\n".join(lines))
+
+
+async def _dispatch(args):
+    """Run the selected command; everything but auth shares one client session."""
+    if args.command == "auth":
+        await authenticate(args.api_id, args.api_hash)
+        return
+    
+    async with session() as app:
+        if args.command == "create-forum":
+            result = await create_forum_group(app, args.title, args.invite_bot, add_to_clawdbot=not args.no_clawdbot)
+            if result and args.folder:
+                await add_to_folder(app, result["id"], args.folder)
+            if result:
+                print(dump_json(result).decode())
+        elif args.command == "create-topic":
+            result = await create_topic(app, args.chat_id, args.name)
+            print(dump_json(result).decode())
+        elif args.command == "add-to-folder":
+            await add_to_folder(app, args.chat_id, args.folder_name)
+        elif args.command == "list":
+            await list_groups(app)
 
 
 def main():
@@ -286,21 +386,14 @@ def main():
     
     args = parser.parse_args()
     
-    if args.command == "auth":
-        asyncio.run(authenticate(args.api_id, args.api_hash))
-    elif args.command == "create-forum":
-        result = asyncio.run(create_forum_group(args.title, args.invite_bot, add_to_clawdbot=not args.no_clawdbot))
-        if result and args.folder:
-            asyncio.run(add_to_folder(result["id"], args.folder))
-        if result:
-            print(json.dumps(result))
-    elif args.command == "create-topic":
-        result = asyncio.run(create_topic(args.chat_id, args.name))
-        print(json.dumps(result))
-    elif args.command == "add-to-folder":
-        asyncio.run(add_to_folder(args.chat_id, args.folder_name))
-    elif args.command == "list":
-        asyncio.run(list_groups())
+    try:
+        import uvloop  # Optional: faster event loop
+        uvloop.install()
+    except ImportError:
+        pass
+    
+    # One event loop for the whole run; _dispatch chains commands on it
+    asyncio.run(_dispatch(args))
 
 
 if __name__ == "__main__":